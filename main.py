@@ -34,9 +34,19 @@ from src import (
     detect_document_language,
     get_bge_embeddings,
     clear_chroma_db_fast,
+    delete_chroma_db_force,
     get_resource_path
 )
 
+# 配置 RAG_SERVER_ADDRESS 后改用共享检索服务（python -m src.retrieval_server），UI进程不再加载模型
+if os.getenv("RAG_SERVER_ADDRESS"):
+    from src.retrieval_client import (
+        build_multi_lang_chroma_db,
+        multi_lang_rag_search,
+        clear_chroma_db_fast,
+        delete_chroma_db_force
+    )
+
 # --- 页面配置 ---
 st.set_page_config(
     page_title="Multi-Lang Academic Agent",
@@ -207,12 +217,13 @@ def main():
         with col2:
             if st.button("删除数据库", help="完全删除数据库文件"):
                 try:
-                    if os.path.exists("chroma_db"):
-                        shutil.rmtree("chroma_db")
-                    # 清空 session
-                    st.session_state.db_instance = None
-                    st.toast("✅ 数据库已删除", icon="🗑️")
-                    st.rerun()  # 强制刷新页面以更新状态
+                    if delete_chroma_db_force():
+                        # 清空 session
+                        st.session_state.db_instance = None
+                        st.toast("✅ 数据库已删除", icon="🗑️")
+                        st.rerun()  # 强制刷新页面以更新状态
+                    else:
+                        st.error("删除未完成：向量库目录仍存在，请查看控制台日志")
                 except Exception as e:
                     st.error(f"删除失败: {e}")
 
@@ -1,7 +1,9 @@
-from .vector_store_query import build_multi_lang_chroma_db,multi_lang_rag_search,is_file_in_chroma_db
-from .loader_pdf_embedding import detect_text_language,detect_document_language,get_bge_embeddings
+from .vector_store_query import build_multi_lang_chroma_db,multi_lang_rag_search,is_file_in_chroma_db,multi_lang_rag_search_by_vector
+from .loader_pdf_embedding import detect_text_language,detect_document_language,get_bge_embeddings,embed_queries_batch
 from .vector_delete import clear_chroma_db_fast,release_file_handles,delete_chroma_db_force
 from  .utils import get_resource_path
-__all__ = ['is_file_in_chroma_db','build_multi_lang_chroma_db','multi_lang_rag_search',
-        'detect_text_language','detect_document_language','get_bge_embeddings',
-        'clear_chroma_db_fast','release_file_handles','delete_chroma_db_force','get_resource_path']
\ No newline at end of file
+from .chroma_registry import open_chroma,get_chroma,is_chroma_open,close_chroma_clients
+__all__ = ['is_file_in_chroma_db','build_multi_lang_chroma_db','multi_lang_rag_search','multi_lang_rag_search_by_vector',
+        'detect_text_language','detect_document_language','get_bge_embeddings','embed_queries_batch',
+        'clear_chroma_db_fast','release_file_handles','delete_chroma_db_force','get_resource_path',
+        'open_chroma','get_chroma','is_chroma_open','close_chroma_clients']
\ No newline at end of file
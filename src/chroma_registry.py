@@ -0,0 +1,94 @@
+# src/chroma_registry.py
+"""
+进程内 Chroma 客户端登记表：
+所有 Chroma 实例都通过 get_chroma / open_chroma 创建并登记，删除/重建向量库前由 close_chroma_clients
+确定性地关闭本进程持有的句柄，无需扫描、结束其他进程
+同一路径、同一集合、同一编码模型只登记一个实例，登记表大小不随调用次数增长
+"""
+import gc
+import os
+import threading
+
+from langchain_chroma import Chroma
+
+# 规范化后的向量库路径 -> {(集合名, id(编码模型)): Chroma实例}
+# 实例持有编码模型的引用，登记期间 id 不会被复用
+_open_dbs = {}
+_lock = threading.Lock()
+
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def open_chroma(embedding_function, persist_directory, collection_name=None):
+    """
+    新建Chroma实例并登记（替换同键的旧实例），用法与 Chroma(embedding_function=..., persist_directory=...) 相同
+    collection_name 为空时使用 langchain 默认集合；一般应使用 get_chroma 复用已有实例
+    """
+    kwargs = {"collection_name": collection_name} if collection_name else {}
+    db = Chroma(
+        embedding_function=embedding_function,
+        persist_directory=persist_directory,
+        **kwargs
+    )
+    with _lock:
+        _open_dbs.setdefault(_normalize(persist_directory), {})[(collection_name, id(embedding_function))] = db
+    return db
+
+
+def get_chroma(embedding_function, persist_directory, collection_name=None):
+    """复用本进程已打开的同路径、同集合、同编码模型的实例，不存在（或已被关闭）时再新建"""
+    with _lock:
+        db = _open_dbs.get(_normalize(persist_directory), {}).get((collection_name, id(embedding_function)))
+    if db is not None:
+        return db
+    return open_chroma(embedding_function, persist_directory, collection_name)
+
+
+def is_chroma_open(db):
+    """判断实例是否仍在登记表中（被 close_chroma_clients 关闭后返回 False）"""
+    with _lock:
+        return any(db is opened for entries in _open_dbs.values() for opened in entries.values())
+
+
+def close_chroma_clients(persist_directory):
+    """
+    关闭本进程中指向该向量库的全部Chroma客户端，释放sqlite3与索引文件句柄
+    :return: 关闭的Chroma实例数量
+    """
+    key = _normalize(persist_directory)
+    with _lock:
+        dbs = list(_open_dbs.pop(key, {}).values())
+
+    closed = len(dbs)
+    systems = []
+    for db in dbs:
+        try:
+            systems.append(db._client._system)
+        except AttributeError:
+            print("⚠️ 无法访问Chroma客户端的System（chromadb内部结构可能已变化），句柄可能未释放")
+    try:
+        # chromadb 按路径缓存共享的 System，不移除的话新建客户端会复用已关闭的实例
+        from chromadb.api.shared_system_client import SharedSystemClient
+        cache = SharedSystemClient._identifier_to_system
+        for identifier in list(cache):
+            if _normalize(identifier) == key:
+                systems.append(cache.pop(identifier))
+    except (ImportError, AttributeError, TypeError, ValueError) as e:
+        print(f"⚠️ 无法访问chromadb的System缓存（内部结构可能已变化），句柄可能未释放：{str(e)}")
+
+    stopped = set()
+    for system in systems:
+        if id(system) in stopped:
+            continue
+        stopped.add(id(system))
+        try:
+            system.stop()
+        except Exception as e:
+            print(f"⚠️ 关闭Chroma客户端时警告：{str(e)}")
+
+    # 释放残留引用，确保底层文件句柄随对象回收立即关闭
+    del dbs, systems
+    gc.collect()
+    return closed
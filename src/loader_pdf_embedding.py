@@ -118,5 +118,12 @@ def get_bge_embeddings(language):
     return embeddings
 
 
-
-
+def embed_queries_batch(queries, language):
+    """
+    批量生成同一语言的查询向量（供检索服务微批处理使用）
+    与 embed_query 结果一致：拼接 query_instruction 后一次性送入模型编码
+    """
+    embeddings = get_bge_embeddings(language)
+    texts = [embeddings.query_instruction + q.replace("\n", " ") for q in queries]
+    vectors = embeddings.client.encode(texts, **embeddings.encode_kwargs)
+    return [v.tolist() for v in vectors]
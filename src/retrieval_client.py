@@ -0,0 +1,84 @@
+# src/retrieval_client.py
+"""
+检索服务的轻量客户端：接口与本地函数保持一致，main.py 中的工具无需修改即可切换到共享检索服务
+UI 进程使用客户端时不加载任何 bge 模型，也不打开 Chroma 客户端
+"""
+import json
+import os
+import socket
+
+from .retrieval_server import parse_address, DEFAULT_ADDRESS
+
+CLIENT_TIMEOUT = 300  # 构建向量库可能耗时较长，超时时间放宽
+
+
+class RetrievalClient:
+    """连接检索服务，每次请求使用一个独立连接（Streamlit 多线程调用下无需加锁）"""
+
+    def __init__(self, address=None):
+        self.address = address or os.getenv("RAG_SERVER_ADDRESS") or DEFAULT_ADDRESS
+
+    def _connect(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(CLIENT_TIMEOUT)
+            sock.connect(target)
+            return sock
+        return socket.create_connection(target, timeout=CLIENT_TIMEOUT)
+
+    def request(self, payload):
+        with self._connect() as sock:
+            sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise ConnectionError("检索服务连接已断开")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "检索服务返回错误"))
+        return response["result"]
+
+    def ping(self):
+        try:
+            return self.request({"op": "ping"}) == "pong"
+        except OSError:
+            return False
+
+
+def build_multi_lang_chroma_db(doc_paths):
+    """
+    与本地同名函数接口一致：由检索服务构建向量库，返回客户端作为 db 句柄
+    doc_paths 为空时（main.py 每次重跑的初始化）只检查服务是否可用，不触发服务端构建
+    """
+    client = RetrievalClient()
+    if not doc_paths:
+        if client.ping():
+            return client
+        print(f"❌ 无法连接检索服务：{client.address}")
+        return None
+    try:
+        print(client.request({"op": "build", "doc_paths": [os.path.abspath(p) for p in doc_paths]}))
+        return client
+    except Exception as e:
+        print(f"❌ 检索服务构建失败：{str(e)}")
+
+
+def multi_lang_rag_search(query, db=None):
+    """与本地同名函数接口一致：db 为 RetrievalClient 实例（为空时按环境变量连接）"""
+    client = db if isinstance(db, RetrievalClient) else RetrievalClient()
+    try:
+        return client.request({"op": "search", "query": query})
+    except Exception as e:
+        return f"❌ 检索服务调用失败：{str(e)}"
+
+
+def clear_chroma_db_fast():
+    """与本地同名函数接口一致：由检索服务清空表数据"""
+    print(RetrievalClient().request({"op": "clear"}))
+
+
+def delete_chroma_db_force():
+    """与本地同名函数接口一致：由检索服务关闭句柄、删除并重建向量库，删除未完成时服务端返回错误"""
+    print(RetrievalClient().request({"op": "delete"}))
+    return True
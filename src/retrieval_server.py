@@ -0,0 +1,198 @@
+# src/retrieval_server.py
+"""
+本地检索服务：多个 Streamlit 进程共享同一份常驻的 bge 模型与 Chroma 客户端
+
+启动方式（项目根目录）：
+    python -m src.retrieval_server                     # 默认监听 127.0.0.1:8765
+    python -m src.retrieval_server unix:/tmp/rag.sock  # Linux/macOS 可用 Unix socket
+
+协议：每行一个 JSON 请求，服务端返回一行 JSON 响应
+    {"op": "search", "query": "..."}       → {"ok": true, "result": "..."}
+    {"op": "build", "doc_paths": [...]}    → {"ok": true, "result": "..."}
+    {"op": "clear"} / {"op": "delete"}     → {"ok": true, "result": "..."}
+    {"op": "ping"}                         → {"ok": true, "result": "pong"}
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .vector_store_query import build_multi_lang_chroma_db, multi_lang_rag_search_by_vector, CHROMA_DB_DIR, DB_EMBEDDING_LANG
+from .loader_pdf_embedding import detect_text_language, embed_queries_batch
+from .vector_delete import clear_chroma_db_fast, delete_chroma_db_force
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"  # 默认监听地址（Windows 不支持 Unix socket，默认走TCP）
+BATCH_WINDOW = 0.01  # 微批处理等待窗口（秒）
+MAX_BATCH_SIZE = 32  # 单批最多合并的查询数
+
+
+def parse_address(address):
+    """
+    解析服务地址
+    :param address: "host:port" 或 "unix:/path/to/socket"
+    :return: ("unix", path) 或 ("tcp", (host, port))
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class RetrievalServer:
+    """
+    常驻检索服务：
+    1. 进程内只加载一次模型、只打开一个 Chroma 客户端
+    2. 并发查询在 BATCH_WINDOW 内合并为一批统一编码
+    3. 模型推理与 Chroma 读写放在单独线程执行，不阻塞事件循环
+    4. 构建/清空/删除走独立的写线程，长时间入库不会阻塞检索批次
+    """
+
+    def __init__(self, batch_window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE):
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        # 检索与写入各用一个单线程执行器：各自内部串行，互不阻塞
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.write_executor = ThreadPoolExecutor(max_workers=1)
+        # 检索批次执行期间持有；清空/删除会关闭客户端，需等待进行中的批次结束
+        self.search_lock = threading.Lock()
+        self.db = None
+        self.queue = None
+        self.batch_task = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.db = await loop.run_in_executor(self.write_executor, build_multi_lang_chroma_db, [])
+        self.batch_task = asyncio.create_task(self._batch_worker())
+        print(f"✅ 检索服务已就绪，向量库路径：{CHROMA_DB_DIR}")
+
+    async def search(self, query):
+        """提交一条查询，等待所在批次处理完成后返回检索结果"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, future))
+        return await future
+
+    async def build(self, doc_paths):
+        """在服务进程内构建/更新向量库，保证检索使用的是同一个 Chroma 客户端"""
+        loop = asyncio.get_running_loop()
+        db = await loop.run_in_executor(self.write_executor, build_multi_lang_chroma_db, doc_paths)
+        if db is None:
+            return "❌ 构建失败，请检查pdf是否属于扫描图片"
+        self.db = db
+        return f"✅ 向量库已更新：{CHROMA_DB_DIR}"
+
+    def _run_exclusive(self, func):
+        """等待进行中的检索批次结束后执行（清空失败时会兜底强制删除，同样会关闭客户端）"""
+        with self.search_lock:
+            self.db = None  # 执行期间的检索直接返回未初始化，不访问正在关闭的客户端
+            return func()
+
+    async def clear(self):
+        """清空后重新打开向量库（清空失败兜底删除时，原客户端已被关闭）"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.write_executor, self._run_exclusive, clear_chroma_db_fast)
+        self.db = await loop.run_in_executor(self.write_executor, build_multi_lang_chroma_db, [])
+        return "✅ 表数据已清空"
+
+    async def delete(self):
+        """删除向量库后立即重建空库，服务无需重启即可继续接收检索与构建请求"""
+        loop = asyncio.get_running_loop()
+        deleted = await loop.run_in_executor(self.write_executor, self._run_exclusive, delete_chroma_db_force)
+        self.db = await loop.run_in_executor(self.write_executor, build_multi_lang_chroma_db, [])
+        if not deleted:
+            raise RuntimeError(f"向量库目录删除未完成：{CHROMA_DB_DIR}")
+        return "✅ 数据库已删除"
+
+    async def _batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 阻塞等待第一条查询，然后在窗口期内尽量收集更多查询
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(self.executor, self._process_batch, [q for q, _ in batch])
+            except Exception as e:
+                results = [f"❌ 检索出错：{str(e)}"] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _process_batch(self, queries):
+        """整批查询只调用一次模型编码（与库内向量同一模型），再按各自语言过滤检索"""
+        with self.search_lock:
+            db = self.db  # 每批只读取一次，批次内不受清空/删除影响
+            if db is None:
+                return ["❌ 向量库未初始化"] * len(queries)
+            print(f"🔍 批量编码 {len(queries)} 条查询")
+            vectors = embed_queries_batch(queries, DB_EMBEDDING_LANG)
+            return [
+                multi_lang_rag_search_by_vector(vector, detect_text_language(query), db, query=query)
+                for query, vector in zip(queries, vectors)
+            ]
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request.get("op")
+                    if op == "search":
+                        result = await self.search(request["query"])
+                    elif op == "build":
+                        result = await self.build(request.get("doc_paths", []))
+                    elif op == "clear":
+                        result = await self.clear()
+                    elif op == "delete":
+                        result = await self.delete()
+                    elif op == "ping":
+                        result = "pong"
+                    else:
+                        raise ValueError(f"未知操作：{op}")
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            # ValueError：单行请求超过 limit；IncompleteReadError：客户端中途断开
+            print(f"⚠️ 连接异常关闭：{str(e)}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve(address=None):
+    """启动检索服务并持续运行"""
+    address = address or os.getenv("RAG_SERVER_ADDRESS") or DEFAULT_ADDRESS
+    server = RetrievalServer()
+    await server.start()
+    kind, target = parse_address(address)
+    if kind == "unix":
+        if os.path.exists(target):
+            os.remove(target)  # 清理上次异常退出残留的socket文件
+        listener = await asyncio.start_unix_server(server.handle_connection, path=target, limit=2 ** 20)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, target[0], target[1], limit=2 ** 20)
+    print(f"🚀 检索服务监听：{address}")
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -1,28 +1,44 @@
-from langchain_chroma import Chroma
 import os
 import shutil
-import time
-import psutil  # 需安装：pip install psutil
+import stat
+import sys
+from .chroma_registry import get_chroma, close_chroma_clients
+from .vector_store_query import CHROMA_DB_DIR, PAPER_COLLECTION, reset_paper_catalog
+
+# 关键优化：用「空embedding」初始化（仅为适配接口，不加载模型）
+class DummyEmbeddings:
+    def embed_documents(self, texts):
+        return [[0.0]*1024]*len(texts)
+    def embed_query(self, text):
+        return [0.0]*1024
+
+
+# 全局唯一实例：登记表按编码模型复用Chroma实例，多次清空不会重复创建
+DUMMY_EMBEDDINGS = DummyEmbeddings()
 
-CHROMA_DB_DIR = "./multi_lang_chroma_db"  # 你的向量库路径
 
 # ===================== 方案1：极简版清空库内数据（跳过模型加载） =====================
 def clear_chroma_db_fast():
 
     try:
-        # 关键优化：用「空embedding」初始化（仅为适配接口，不加载模型）
-        class DummyEmbeddings:
-            def embed_documents(self, texts):
-                return [[0.0]*1024]*len(texts)
-            def embed_query(self, text):
-                return [0.0]*1024
-
         # 初始化Chroma（无模型加载，1秒内完成）
-        db = Chroma(
-            embedding_function=DummyEmbeddings(),  # 虚拟embedding，跳过模型加载
+        db = get_chroma(
+            embedding_function=DUMMY_EMBEDDINGS,  # 虚拟embedding，跳过模型加载
             persist_directory=CHROMA_DB_DIR
         )
 
+        # 同步清空论文级路由索引（每篇论文仅一条记录，一次删除即可）
+        paper_index = get_chroma(
+            embedding_function=DUMMY_EMBEDDINGS,
+            persist_directory=CHROMA_DB_DIR,
+            collection_name=PAPER_COLLECTION
+        )
+        paper_ids = paper_index.get()["ids"]
+        if paper_ids:
+            paper_index.delete(ids=paper_ids)
+            print(f"✅ 已清空论文级索引，共 {len(paper_ids)} 篇论文")
+        reset_paper_catalog()
+
         # 步骤1：获取所有文档ID（分批处理）
         all_docs = db.get()
         all_doc_ids = all_docs["ids"]
@@ -31,13 +47,12 @@ def clear_chroma_db_fast():
             return
         print(f"🔍 检测到 {len(all_doc_ids)} 个文本块，开始分批删除...")
 
-        # 步骤2：分批删除（每批100个，避免锁等待）
+        # 步骤2：分批删除（每批100个，同进程共用一个客户端，无需等待锁释放）
         batch_size = 100
         for i in range(0, len(all_doc_ids), batch_size):
             batch_ids = all_doc_ids[i:i+batch_size]
             db.delete(ids=batch_ids)
             print(f"✅ 已删除第 {i//batch_size + 1} 批，共删除 {len(batch_ids)} 个文本块")
-            time.sleep(0.1)  # 释放锁，避免sqlite3阻塞
 
         # 验证清空结果
         after_docs = db.get()
@@ -49,55 +64,58 @@ def clear_chroma_db_fast():
         print("🔧 尝试强制删除整个向量库...")
         delete_chroma_db_force()
 
-# ===================== 方案2：强制删除向量库（释放句柄+管理员权限） =====================
+# ===================== 方案2：强制删除向量库（关闭本进程句柄后直接删除） =====================
 def release_file_handles():
     """
-    释放Windows下Chroma的sqlite3文件句柄（关键！解决隐性占用）
+    关闭本进程登记过的全部Chroma客户端，释放chroma.sqlite3等文件句柄
+    只处理本进程持有的句柄，不会扫描或结束其他进程
     """
     try:
-        # 遍历所有Python进程，关闭chroma.sqlite3的句柄
-        for proc in psutil.process_iter(['pid', 'name', 'open_files']):
-            try:
-                for file in proc.open_files():
-                    if 'chroma.sqlite3' in file.path and CHROMA_DB_DIR in file.path:
-                        print(f"🔓 释放文件句柄：{file.path}（进程PID：{proc.pid}）")
-                        proc.kill()  # 关闭占用句柄的Python进程
-                        time.sleep(1)
-            except (psutil.AccessDenied, psutil.NoSuchProcess):
-                continue
+        closed = close_chroma_clients(CHROMA_DB_DIR)
+        print(f"🔓 已关闭 {closed} 个Chroma客户端")
     except Exception as e:
         print(f"⚠️ 释放句柄时警告：{str(e)}")
 
+
+def _force_remove(func, path, exc):
+    """rmtree 删除失败时（如Windows只读文件），赋予写权限后重试；第三个参数兼容 onexc/onerror 两种回调"""
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
 def delete_chroma_db_force():
     """
     强制删除向量库目录（先释放句柄，再删除）
+    :return: bool，目录确实已不存在时返回 True
     """
     try:
-        # 步骤1：释放文件句柄
+        # 步骤1：释放本进程的文件句柄，并使论文目录缓存失效
         release_file_handles()
-        time.sleep(2)  # 等待句柄释放
+        reset_paper_catalog()
 
-        # 步骤2：强制删除目录
+        # 步骤2：删除目录
         if os.path.exists(CHROMA_DB_DIR):
-            # 先清空目录内文件（避免权限不足）
-            for root, dirs, files in os.walk(CHROMA_DB_DIR, topdown=False):
-                for name in files:
-                    file_path = os.path.join(root, name)
-                    os.chmod(file_path, 0o777)  # 赋予所有权限
-                    os.remove(file_path)
-                for name in dirs:
-                    dir_path = os.path.join(root, name)
-                    os.rmdir(dir_path)
-            # 删除主目录
-            shutil.rmtree(CHROMA_DB_DIR, ignore_errors=True)
-            print(f"✅ 强制删除成功！已删除目录：{CHROMA_DB_DIR}")
+            if sys.version_info >= (3, 12):
+                shutil.rmtree(CHROMA_DB_DIR, onexc=_force_remove)
+            else:
+                shutil.rmtree(CHROMA_DB_DIR, onerror=_force_remove)
         else:
             print(f"ℹ️ 向量库目录不存在：{CHROMA_DB_DIR}")
+            return True
+
+        # 步骤3：确认目录已删除，句柄未释放时rmtree可能只删除了部分文件
+        if os.path.exists(CHROMA_DB_DIR):
+            print(f"❌ 删除未完成，目录仍存在：{CHROMA_DB_DIR}")
+            return False
+        print(f"✅ 强制删除成功！已删除目录：{CHROMA_DB_DIR}")
+        return True
 
     except PermissionError:
         print("❌ 权限不足！请按以下步骤操作：")
         print("1. 以管理员身份运行Python/CMD；")
         print("2. 关闭所有打开的文件管理器窗口（尤其是向量库目录）；")
-        print("3. 重新运行本代码。")
+        print("3. 若启用了检索服务，请通过检索服务删除或先停止检索服务；")
+        print("4. 重新运行本代码。")
     except Exception as e:
         print(f"❌ 强制删除失败：{str(e)}")
+    return False
@@ -1,13 +1,26 @@
-from langchain_chroma import Chroma
 from langdetect import detect, DetectorFactory
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from .loader_pdf_embedding import *
 import os
+import re
+import threading
+from langchain_core.documents import Document
 from .utils import get_resource_path
+from .chroma_registry import get_chroma, is_chroma_open
 
 CHROMA_DB_DIR = get_resource_path("./multi_lang_chroma_db")  # Chroma向量库存储路径
 CHUNK_SIZE = 512  # 文本分块大小
 CHUNK_OVERLAP = 64  # 分块重叠长度
+# 注：Chroma.add_documents 会忽略 embedding 参数，库内所有向量实际都由 db 的 embedding_function 编码，
+# 查询向量必须使用同一个模型生成
+DB_EMBEDDING_LANG = "zh"
+PAPER_COLLECTION = "paper_index"  # 论文级路由索引（每篇论文一个向量：标题+摘要）
+PAPER_SUMMARY_CHARS = 1000  # 论文级向量使用的摘要长度
+ROUTE_TOP_PAPERS = 5  # 粗排：语义路由选出的论文数
+NAMED_PAPER_K = 2  # 查询中点名的论文，每篇单独检索的文本块数
+NAMED_PAPER_MIN_WORDS = 3  # 点名识别：英文名称至少包含的词数
+NAMED_PAPER_MIN_CJK = 6  # 点名识别：中文名称至少包含的汉字数
+SEARCH_K = 3  # 精排：返回的文本块数
 DetectorFactory.seed = 0  # 固定语言检测种子，结果稳定
 
 
@@ -50,11 +63,15 @@ def build_multi_lang_chroma_db(doc_paths):
     4. 前置检查：跳过已存入的文件
     """
     # 初始化空的Chroma库（统一存储）
-    db = Chroma(
-        embedding_function=get_bge_embeddings("zh"),
+    db = get_chroma(
+        embedding_function=get_bge_embeddings(DB_EMBEDDING_LANG),
         persist_directory=CHROMA_DB_DIR
     )
+    paper_index = get_paper_index(db)
     try:
+        # 旧版本构建的向量库没有论文级索引，首次启动时从已有文本块补建
+        backfill_paper_index(db, paper_index)
+
         for file_path in doc_paths:
             # ===== 新增：前置检查文件是否已存在 =====
             if is_file_in_chroma_db(db, file_path):
@@ -98,72 +115,242 @@ def build_multi_lang_chroma_db(doc_paths):
 
             # 步骤5：将当前论文的向量添加到统一Chroma库
             db.add_documents(documents=split_docs, embedding=embeddings)
+            # 步骤6：写入论文级路由索引（标题+摘要，一篇论文一个向量）
+            source = os.path.basename(file_path)
+            paper_index.add_documents(
+                documents=[make_paper_document(source, lang, filtered_docs)],
+                ids=[source]
+            )
             print(f"✅ 成功添加论文：{os.path.basename(file_path)} | 语言：{lang} | 文本块数：{len(split_docs)}")
 
+        reset_paper_catalog()
         print(f"\n🎉 所有论文处理完成！向量库存储路径：{CHROMA_DB_DIR}")
         return db
     except Exception as e:
         print("输入pdf或txt格式有误，请检查pdf是否属于扫描图片")
 
 
-# 多语言RAG检索函数（核心：查询语言匹配+元数据过滤）
+def get_paper_index(db):
+    """获取与文本块库同目录、同编码模型的论文级路由索引"""
+    return get_chroma(
+        embedding_function=db.embeddings,
+        persist_directory=CHROMA_DB_DIR,
+        collection_name=PAPER_COLLECTION
+    )
+
+
+def extract_paper_summary(text):
+    """优先截取摘要（Abstract/摘要）段落，找不到时取正文开头"""
+    text = re.sub(r'\s+', ' ', text).strip()
+    match = re.search(r'(abstract|摘\s*要)[\s:：.—-]*', text[:5000], re.IGNORECASE)
+    start = match.end() if match else 0
+    return text[start:start + PAPER_SUMMARY_CHARS]
+
+
+# PDF元数据中常见的无效标题（由编辑器/转换工具自动填写）
+_JUNK_TITLE_PATTERN = re.compile(
+    r'^(microsoft\s+\w+\s*-|untitled|document\s*\d*$|doc\d*$|slide|draft|arxiv:|preprint|title\s*$)'
+    r'|\.(docx?|pdf|tex|dvi|ps)$',
+    re.IGNORECASE
+)
+
+
+def is_plausible_title(title):
+    """判断候选标题是否可信：长度适中、含字母或汉字、不是工具默认值或arXiv页边戳"""
+    title = (title or "").strip()
+    if not 8 <= len(title) <= 250:
+        return False
+    if not re.search(r'[A-Za-z\u4e00-\u9fff]', title):
+        return False
+    return not _JUNK_TITLE_PATTERN.search(title)
+
+
+def make_paper_document(source, lang, docs, use_first_line=True):
+    """
+    构建论文级文档：标题 + 摘要
+    标题优先取首页第一行，其次取可信的PDF元数据标题，都不可用时使用文件名
+    use_first_line=False 时（docs 为文本块而非整页）跳过首行，只用元数据标题或文件名
+    """
+    first_line = ""
+    metadata_title = ""
+    if docs:
+        if use_first_line:
+            first_line = next((line.strip() for line in docs[0].page_content.splitlines() if line.strip()), "")
+        metadata_title = (docs[0].metadata.get("title") or "").strip()
+    title = next(
+        (t for t in (first_line, metadata_title) if is_plausible_title(t)),
+        os.path.splitext(source)[0]
+    )
+    summary = extract_paper_summary(" ".join(doc.page_content for doc in docs[:3]))
+    return Document(
+        page_content=f"{title}\n{summary}",
+        metadata={"source": source, "lang": lang, "title": title}
+    )
+
+
+def backfill_paper_index(db, paper_index):
+    """论文级索引为空而文本块库非空时，按来源汇总已有文本块补建索引（只执行一次）"""
+    if paper_index.get(limit=1)["ids"] or not db.get(limit=1)["ids"]:
+        return
+    all_chunks = db.get(include=["documents", "metadatas"])
+    papers = {}
+    for content, metadata in zip(all_chunks["documents"], all_chunks["metadatas"]):
+        source = metadata.get("source", "未知论文")
+        papers.setdefault(source, (metadata.get("lang", "unknown"), []))[1].append(
+            Document(page_content=content, metadata=metadata)
+        )
+    # db.get() 不保证文本块顺序：按页码排序后再截取摘要；文本块的首行不是论文标题，不参与取标题
+    paper_docs = [
+        make_paper_document(
+            source, lang, sorted(chunks, key=lambda doc: doc.metadata.get("page", 0)), use_first_line=False
+        )
+        for source, (lang, chunks) in papers.items()
+    ]
+    paper_index.add_documents(documents=paper_docs, ids=list(papers))
+    print(f"✅ 已为 {len(paper_docs)} 篇已有论文补建论文级索引")
+
+
+# 论文目录缓存：避免每次查询都读取全部论文元数据
+# 构建/清空/删除向量库时由 reset_paper_catalog 显式失效，论文数变化（如其他进程入库）时也会重新加载
+_paper_catalog = {"count": -1, "papers": []}
+_paper_catalog_lock = threading.Lock()
+
+
+def reset_paper_catalog():
+    """使论文目录缓存失效，下次点名识别时重新读取论文级索引"""
+    with _paper_catalog_lock:
+        _paper_catalog["count"] = -1
+        _paper_catalog["papers"] = []
+
+
+def _normalize_name(text):
+    """统一为小写，标点、下划线等替换为空格，便于按整词匹配"""
+    return re.sub(r'[^0-9a-z\u4e00-\u9fff]+', ' ', (text or "").lower()).strip()
+
+
+def _paper_names(metadata):
+    """
+    论文可用于点名识别的名称：标题，以及去掉arXiv编号前缀后的文件名
+    只保留足够长的名称（英文≥3个词，中文≥6个汉字），单个词如 bert、survey 不参与识别
+    """
+    stem = re.sub(r'^\d{4}\.\d{4,5}(v\d+)?_', '', os.path.splitext(metadata["source"])[0])
+    names = []
+    for name in {_normalize_name(metadata.get("title")), _normalize_name(stem)}:
+        if len(re.findall(r'[\u4e00-\u9fff]', name)) >= NAMED_PAPER_MIN_CJK or len(name.split()) >= NAMED_PAPER_MIN_WORDS:
+            names.append(name)
+    return names
+
+
+def _name_in_query(name, query):
+    """英文名称要求整词匹配；中文不以空格分词，直接按子串匹配（已有长度下限）"""
+    if re.search(r'[\u4e00-\u9fff]', name):
+        return name in query
+    return f" {name} " in f" {query} "
+
+
+def find_named_papers(query, paper_index):
+    """匹配查询中点名的论文（完整标题或文件名出现在查询中），没有明确点名时返回空列表，交由语义路由"""
+    count = paper_index._collection.count()  # langchain_chroma 未暴露计数接口，直接读取底层集合
+    with _paper_catalog_lock:
+        if count != _paper_catalog["count"]:
+            metadatas = paper_index.get(include=["metadatas"])["metadatas"]
+            _paper_catalog["papers"] = [(m["source"], _paper_names(m)) for m in metadatas]
+            _paper_catalog["count"] = count
+        papers = _paper_catalog["papers"]
+    query = _normalize_name(query)
+    return [source for source, names in papers if any(_name_in_query(n, query) for n in names)]
+
+
+def route_and_search(query, query_vector, query_lang, db):
+    """
+    粗到细检索：
+    1. 粗排：查询中点名了论文则直接选中；否则在论文级索引中检索同语言的前 ROUTE_TOP_PAPERS 篇论文
+    2. 精排：按 source 元数据过滤，只在选中论文的文本块内检索
+    3. 论文级索引为空时退回全库检索
+    注：文本块仍存放在同一个全局集合中，精排是带元数据过滤的 k-NN，
+    实际开销取决于 Chroma 的过滤检索实现，并不严格只与选中论文数成正比
+    """
+    paper_index = get_paper_index(db)
+
+    named = find_named_papers(query, paper_index) if query else []
+    if named:
+        # 对比类查询：每篇点名论文单独分配检索名额，避免某一篇占满全部结果
+        print(f"📄 查询点名论文：{named}")
+        relevant_docs = []
+        for source in named:
+            relevant_docs.extend(db.similarity_search_by_vector(
+                query_vector, k=NAMED_PAPER_K, filter={"source": source}
+            ))
+        return relevant_docs
+
+    papers = paper_index.similarity_search_by_vector(
+        query_vector, k=ROUTE_TOP_PAPERS, filter={"lang": query_lang}
+    )
+    if not papers:
+        return db.similarity_search_by_vector(query_vector, k=SEARCH_K, filter={"lang": query_lang})
+    sources = [paper.metadata["source"] for paper in papers]
+    print(f"📄 路由选中论文：{sources}")
+    return db.similarity_search_by_vector(
+        query_vector,
+        k=SEARCH_K,
+        filter={"$and": [{"lang": query_lang}, {"source": {"$in": sources}}]}
+    )
+
+
+def format_relevant_docs(relevant_docs):
+    """将检索到的文本块拼接为带来源标注的结果字符串"""
+    result = []
+    for i, doc in enumerate(relevant_docs):
+        source = doc.metadata.get("source", "未知论文")
+        result.append(f"【相关片段{i + 1} | 来源：{source}】\n{doc.page_content}")
+    return "\n\n".join(result)
+
+
+# 多语言RAG检索函数（核心：查询语言匹配+论文级路由+元数据过滤）
 def multi_lang_rag_search(query, db):
     """
     多语言检索逻辑：
-    1. 检测查询语言 → 用对应模型生成查询向量
-    2. 过滤同语言的论文片段 → 精准检索
-    3. 支持跨论文联合检索
+    1. 检测查询语言 → 生成查询向量
+    2. 论文级索引选出相关论文（或查询中点名的论文）
+    3. 只在选中论文的同语言片段中精准检索
+    4. 支持跨论文联合检索
     """
     try:
         # 步骤1：检测查询语言
         query_lang = detect_text_language(query)
         print(f"🔍 检测到查询语言：{query_lang}")
 
-        # 步骤2：获取对应模型，生成查询向量
-        embeddings = get_bge_embeddings(query_lang)
-
-        # 步骤3：构建带语言过滤的检索器
-        retriever = db.as_retriever(
-            search_kwargs={
-                "k": 3,
-                "filter": {"lang": query_lang}  # 只检索同语言片段
-            },
-            embedding=embeddings
-        )
-
-        # 步骤4：执行检索（核心修复：替换旧方法）
-        # 适配LangChain v0.1+ 新版接口
-        relevant_docs = retriever.invoke(query)
-
-        # 空结果处理
-        if not relevant_docs:
-            return f"❌ 未检索到{query_lang}语言的相关内容"
+        # 步骤2：生成查询向量（与库内向量使用同一模型）
+        query_vector = db.embeddings.embed_query(query)
 
-        # 步骤5：结构化拼接结果
-        result = []
-        for i, doc in enumerate(relevant_docs):
-            source = doc.metadata.get("source", "未知论文")
-            result.append(f"【相关片段{i + 1} | 来源：{source}】\n{doc.page_content}")
-        return "\n\n".join(result)
-
-    # 兜底：适配极旧版本LangChain（兼容get_relevant_documents）
-    except AttributeError as e:
-        if "invoke" in str(e):
-            try:
-                relevant_docs = retriever.get_relevant_documents(query)
-                if not relevant_docs:
-                    return f"❌ 未检索到{query_lang}语言的相关内容"
-                result = []
-                for i, doc in enumerate(relevant_docs):
-                    source = doc.metadata.get("source", "未知论文")
-                    result.append(f"【相关片段{i + 1} | 来源：{source}】\n{doc.page_content}")
-                return "\n\n".join(result)
-            except Exception as e2:
-                return f"❌ 检索方法适配失败：{str(e2)}"
-        return f"❌ 属性错误：{str(e)}"
+        # 步骤3-5：粗到细检索 + 结构化拼接结果
+        return multi_lang_rag_search_by_vector(query_vector, query_lang, db, query=query)
 
     # 捕获其他异常（模型加载、向量库连接等）
     except Exception as e:
         return f"❌ 检索出错：{str(e)}"
 
 
+def resolve_live_db(db):
+    """
+    传入的实例已被关闭时（如删除数据库后，缓存的Agent工具仍持有旧实例），
+    换用登记表中同编码模型的当前实例，删除重建后同一进程内检索仍可用
+    """
+    if is_chroma_open(db):
+        return db
+    return get_chroma(embedding_function=db.embeddings, persist_directory=CHROMA_DB_DIR)
+
+
+def multi_lang_rag_search_by_vector(query_vector, query_lang, db, query=None):
+    """
+    使用预先计算好的查询向量检索（检索服务微批处理后调用）
+    过滤规则与 multi_lang_rag_search 一致，传入 query 时支持按论文名直接选中论文
+    """
+    try:
+        db = resolve_live_db(db)
+        relevant_docs = route_and_search(query, query_vector, query_lang, db)
+        if not relevant_docs:
+            return f"❌ 未检索到{query_lang}语言的相关内容"
+        return format_relevant_docs(relevant_docs)
+    except Exception as e:
+        return f"❌ 检索出错：{str(e)}"